@@ -17,9 +17,7 @@ from sklearn.metrics import r2_score
 from datetime import datetime
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-# Append the project directory to the path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from opendrive2catmull.opendrive_converter import get_road_geometry, generate_spline
+from .opendrive_converter import get_road_geometry, generate_spline
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
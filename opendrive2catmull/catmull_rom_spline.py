@@ -1,90 +1,156 @@
-"""
-This module defines a Catmull-Rom spline class and functions to generate splines from given points.
-
-:param points: List of control points (x, y, [z, width]). At least 4 points are required.
-:param num_spline_points: Number of points to generate per segment, default is 1.
-:return: Generated Catmull-Rom spline points with optional z and width values.
-"""
-import numpy as np
-
-class CatmullRomSpline:
-    def __init__(self, points, alpha=0.5, num_spline_points=1):
-        # Initialize the spline with given points, alpha, and number of spline points
-        self.points = np.array(points)
-        self.alpha = alpha
-        self.num_spline_points = num_spline_points
-        self.tangents = self.calculate_tangents()
-        
-    def tj(self, ti, p_i, p_j):
-        # Calculate the parameter t for the given points
-        xi, yi = p_i[:2]
-        xj, yj = p_j[:2]
-        return (((xj - xi) ** 2 + (yj - yi) ** 2) ** 0.5) ** self.alpha + ti
-    
-    def calculate_tangents(self):
-        # Calculate tangents for the spline points
-        tangents = []
-        for i in range(1, len(self.points) - 1):
-            t0 = 0
-            t1 = self.tj(t0, self.points[i-1][:2], self.points[i][:2])
-            t2 = self.tj(t1, self.points[i][:2], self.points[i+1][:2])
-            tangent = (t2 - t0) * (self.points[i+1][:2] - self.points[i-1][:2])
-            if np.linalg.norm(tangent) == 0:
-                tangent = np.array([1e-6, 1e-6])
-            tangents.append(tangent)
-        tangents = np.array(tangents)
-        tangents = np.concatenate([np.array([tangents[0]]), tangents, np.array([tangents[-1]])])
-        return tangents
-
-    def generate_spline(self):
-        # Generate the Catmull-Rom spline
-        spline = []
-        for i in range(len(self.points) - 3):
-            p0, p1, p2, p3 = self.points[i], self.points[i+1], self.points[i+2], self.points[i+3]
-            t0, t1, t2, t3 = 0, self.tj(0, p0, p1), self.tj(self.tj(0, p0, p1), p1, p2), self.tj(self.tj(self.tj(0, p0, p1), p1, p2), p2, p3)
-            t = np.linspace(t1, t2, self.num_spline_points).reshape(self.num_spline_points, 1)
-            
-            t1 = max(t1, t0 + 1e-6)
-            t2 = max(t2, t1 + 1e-6)
-            t3 = max(t3, t2 + 1e-6)
-
-            # Calculate intermediate points
-            a1 = (t1 - t) / (t1 - t0) * p0[:2] + (t - t0) / (t1 - t0) * p1[:2]
-            a2 = (t2 - t) / (t2 - t1) * p1[:2] + (t - t1) / (t2 - t1) * p2[:2]
-            a3 = (t3 - t) / (t3 - t2) * p2[:2] + (t - t2) / (t3 - t2) * p3[:2]
-
-            # Calculate intermediate points
-            b1 = (t2 - t) / (t2 - t0) * a1 + (t - t0) / (t2 - t0) * a2
-            b2 = (t3 - t) / (t3 - t1) * a2 + (t - t1) / (t3 - t1) * a3
-
-            # Calculate final point
-            c = (t2 - t) / (t2 - t1) * b1 + (t - t1) / (t2 - t1) * b2
-
-            # Interpolate z and width values
-            z_values = np.linspace(p1[2], p2[2], self.num_spline_points)
-            width_values = np.linspace(p1[3], p2[3], self.num_spline_points)
-
-            # Append the calculated points to the spline
-            for j, p in enumerate(c):
-                spline.append((p[0], p[1], z_values[j], width_values[j]))
-
-        return np.array(spline)
-
-def catmull_rom_chain(points, num_spline_points=1):
-    # Generate a Catmull-Rom spline chain from the given points
-    if len(points) < 4:
-        raise ValueError("At least 4 points are required")
-    
-    spline_generator = CatmullRomSpline(points, num_spline_points=num_spline_points)
-    return spline_generator.generate_spline()
-
-def catmull_rom(points, num_spline_points=1):
-    # Generate a Catmull-Rom spline with default z and width values if not provided
-    if len(points) < 4:
-        raise ValueError("At least 4 points are required")
-    
-    complete_points = [(p[0], p[1], p[2] if len(p) > 2 else 0.0, p[3] if len(p) > 3 else 8.0) for p in points]
-
-    spline_points = catmull_rom_chain(complete_points, num_spline_points)
-    
-    return spline_points
+"""
+This module defines a Catmull-Rom spline class and functions to generate splines from given points.
+
+:param points: List of control points (x, y, [z, width]). At least 4 points are required.
+:param num_spline_points: Number of points to generate per segment, default is 1.
+:param dtype: Floating point type of the spline points, default is float64. float32 halves the memory traffic where its precision is enough.
+:return: Generated Catmull-Rom spline points with optional z and width values.
+"""
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the NumPy path is used without it
+    njit = None
+
+class CatmullRomSpline:
+    def __init__(self, points, alpha=0.5, num_spline_points=1, dtype=np.float64):
+        # Initialize the spline with given points, alpha, number of spline points and floating point type
+        self.points = np.asarray(points, dtype=dtype)
+        self.alpha = alpha
+        self.num_spline_points = num_spline_points
+        self.tangents = self.calculate_tangents()
+        
+    def tj(self, ti, p_i, p_j):
+        # Calculate the parameter t for the given points with scalar math, not NumPy ops
+        dx = float(p_j[0]) - float(p_i[0])
+        dy = float(p_j[1]) - float(p_i[1])
+        return math.pow(math.hypot(dx, dy), self.alpha) + ti
+    
+    def calculate_tangents(self):
+        # Calculate tangents for all inner spline points at once
+        seg = _knot_intervals(self.points, self.alpha)
+        t0 = 0
+        t2 = seg[:-1] + seg[1:]
+        tangents = (t2 - t0)[:, None] * (self.points[2:, :2] - self.points[:-2, :2])
+        # Replace zero-length tangents, checked on the squared norm
+        tangents[np.einsum('ij,ij->i', tangents, tangents) == 0] = 1e-6
+        tangents = np.concatenate([tangents[:1], tangents, tangents[-1:]])
+        return tangents
+
+    def generate_spline(self):
+        # Generate the Catmull-Rom spline
+        return _generate_spline(self.points, self.num_spline_points, self.alpha)
+
+def _knot_intervals(points, alpha):
+    # Parameter interval ||P[i+1] - P[i]|| ** alpha between consecutive points, each computed once
+    diffs = np.diff(points[:, :2], axis=0)
+    return np.einsum('ij,ij->i', diffs, diffs) ** (0.5 * alpha)
+
+def _catmull_vectorized(points, num_spline_points, alpha):
+    # Generate the Catmull-Rom spline for all segments at once with NumPy
+    P = points[:, :2]
+    p0, p1, p2, p3 = P[:-3], P[1:-2], P[2:-1], P[3:]
+    seg = _knot_intervals(points, alpha)
+    t0 = 0
+    t1 = seg[:-2]
+    t2 = t1 + seg[1:-1]
+    t3 = t2 + seg[2:]
+    # Parameter values per segment, shape (segments, num_spline_points)
+    t = np.linspace(t1, t2, num_spline_points, axis=1)
+
+    t1 = np.maximum(t1, t0 + 1e-6)
+    t2 = np.maximum(t2, t1 + 1e-6)
+    t3 = np.maximum(t3, t2 + 1e-6)
+
+    # Broadcast everything to (segments, num_spline_points, 2)
+    t = t[:, :, None]
+    t1, t2, t3 = t1[:, None, None], t2[:, None, None], t3[:, None, None]
+    p0, p1, p2, p3 = p0[:, None, :], p1[:, None, :], p2[:, None, :], p3[:, None, :]
+
+    # Calculate intermediate points
+    a1 = (t1 - t) / (t1 - t0) * p0 + (t - t0) / (t1 - t0) * p1
+    a2 = (t2 - t) / (t2 - t1) * p1 + (t - t1) / (t2 - t1) * p2
+    a3 = (t3 - t) / (t3 - t2) * p2 + (t - t2) / (t3 - t2) * p3
+
+    # Calculate intermediate points
+    b1 = (t2 - t) / (t2 - t0) * a1 + (t - t0) / (t2 - t0) * a2
+    b2 = (t3 - t) / (t3 - t1) * a2 + (t - t1) / (t3 - t1) * a3
+
+    # Write (x, y, z, width) rows, segment by segment, into a preallocated output
+    out = np.empty((len(t), num_spline_points, 4), dtype=points.dtype)
+
+    # Calculate final points
+    out[:, :, :2] = (t2 - t) / (t2 - t1) * b1 + (t - t1) / (t2 - t1) * b2
+
+    # Interpolate z and width values
+    out[:, :, 2] = np.linspace(points[1:-2, 2], points[2:-1, 2], num_spline_points, axis=1)
+    out[:, :, 3] = np.linspace(points[1:-2, 3], points[2:-1, 3], num_spline_points, axis=1)
+
+    return out.reshape(-1, 4)
+
+def _catmull_kernel(points, intervals, num_spline_points, out):
+    # Scalar Catmull-Rom kernel writing straight into out, compiled with numba when available
+    K = num_spline_points
+    for seg in range(points.shape[0] - 3):
+        t0 = 0.0
+        t1 = intervals[seg]
+        t2 = t1 + intervals[seg+1]
+        t3 = t2 + intervals[seg+2]
+
+        # Sample positions use the unclamped knots, the interpolation the clamped ones
+        s1, s2 = t1, t2
+        t1 = max(t1, t0 + 1e-6)
+        t2 = max(t2, t1 + 1e-6)
+        t3 = max(t3, t2 + 1e-6)
+
+        for j in range(K):
+            u = j / (K - 1) if K > 1 else 0.0
+            t = s1 + (s2 - s1) * u
+            row = seg * K + j
+            for k in range(2):
+                q0, q1, q2, q3 = points[seg, k], points[seg+1, k], points[seg+2, k], points[seg+3, k]
+                a1 = (t1 - t) / (t1 - t0) * q0 + (t - t0) / (t1 - t0) * q1
+                a2 = (t2 - t) / (t2 - t1) * q1 + (t - t1) / (t2 - t1) * q2
+                a3 = (t3 - t) / (t3 - t2) * q2 + (t - t2) / (t3 - t2) * q3
+                b1 = (t2 - t) / (t2 - t0) * a1 + (t - t0) / (t2 - t0) * a2
+                b2 = (t3 - t) / (t3 - t1) * a2 + (t - t1) / (t3 - t1) * a3
+                out[row, k] = (t2 - t) / (t2 - t1) * b1 + (t - t1) / (t2 - t1) * b2
+            # Interpolate z and width values
+            out[row, 2] = points[seg+1, 2] + (points[seg+2, 2] - points[seg+1, 2]) * u
+            out[row, 3] = points[seg+1, 3] + (points[seg+2, 3] - points[seg+1, 3]) * u
+    return out
+
+if njit is not None:
+    _catmull_kernel = njit(cache=True, fastmath=True, boundscheck=False)(_catmull_kernel)
+
+def _generate_spline(points, num_spline_points, alpha):
+    # Dispatch to the compiled kernel when numba is installed, otherwise to the NumPy path.
+    # The output has the dtype of the points, numba compiles one kernel per dtype.
+    if njit is None:
+        return _catmull_vectorized(points, num_spline_points, alpha)
+    points = np.ascontiguousarray(points)
+    # The kernel runs without bounds checks, so make sure the z and width columns exist
+    if points.ndim != 2 or points.shape[1] < 4:
+        raise ValueError("Points must have x, y, z and width columns")
+    out = np.empty((max(len(points) - 3, 0) * num_spline_points, 4), dtype=points.dtype)
+    return _catmull_kernel(points, _knot_intervals(points, alpha), int(num_spline_points), out)
+
+def catmull_rom_chain(points, num_spline_points=1):
+    # Generate a Catmull-Rom spline chain from the given points
+    if len(points) < 4:
+        raise ValueError("At least 4 points are required")
+    
+    return _generate_spline(np.asarray(points, dtype=np.float64), num_spline_points, alpha=0.5)
+
+def catmull_rom(points, num_spline_points=1):
+    # Generate a Catmull-Rom spline with default z and width values if not provided
+    if len(points) < 4:
+        raise ValueError("At least 4 points are required")
+    
+    complete_points = [(p[0], p[1], p[2] if len(p) > 2 else 0.0, p[3] if len(p) > 3 else 8.0) for p in points]
+
+    spline_points = catmull_rom_chain(complete_points, num_spline_points)
+    
+    return spline_points
@@ -6,20 +6,26 @@ and saves each road section as a separate XML file in the specified output folde
 :param output_folder: Path to the folder where the output XML files will be saved.
 """
 import json
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+try:
+    import orjson  # SIMD JSON parser, falls back to the json module
+except ImportError:
+    orjson = None
+try:
+    import lxml.etree as ET  # C serializer, same Element/indent/write API
+except ImportError:
+    import xml.etree.ElementTree as ET
 import os
+import argparse
 
 def prettify_xml(elem):
     """Return a pretty-printed XML string for the Element."""
-    rough_string = ET.tostring(elem, 'utf-8')  # Convert the Element to a string
-    reparsed = minidom.parseString(rough_string)  # Parse the string using minidom
-    return reparsed.toprettyxml(indent="    ")  # Return the pretty-printed XML string with indentation
+    ET.indent(elem, space="    ")  # Indent the tree in place
+    return ET.tostring(elem, encoding="utf-8", xml_declaration=True).decode("utf-8")  # Serialize it in a single pass
 
 def convert_json_to_opendrive(json_file, output_folder):
     # Open and read the JSON file
-    with open(json_file, 'r') as f:
-        data = json.load(f)
+    with open(json_file, 'rb') as f:
+        data = orjson.loads(f.read()) if orjson is not None else json.load(f)
 
     # Ensure the output folder exists
     os.makedirs(output_folder, exist_ok=True)
@@ -76,14 +82,19 @@ def convert_json_to_opendrive(json_file, output_folder):
                     # Create the roadMark element with its attributes
                     roadMark = ET.SubElement(lane_elem, 'roadMark', type=lane_data['roadMark']['@type'], width=lane_data['roadMark']['@width'])
             
-            # Pretty-print the XML
-            pretty_xml = prettify_xml(root)
+            # Indent the XML in place
+            ET.indent(root, space="    ")
             
             # Write the pretty-printed XML to the output file named with the road ID
             xodr_file = os.path.join(output_folder, f"{road_data['@id']}.xodr")
-            with open(xodr_file, 'w') as f:
-                f.write(pretty_xml)
+            ET.ElementTree(root).write(xodr_file, encoding="utf-8", xml_declaration=True)
 
 
-# Example usage
-convert_json_to_opendrive(r'C:\\Users\\Qurban\\Documents\\GitHub\\Sensodat\\sdc_sim_data.campaign_2_ambiegen.json', r'C:\Users\Qurban\Documents\campaign_2_ambiegen')
+# Example usage:
+#   python json2xodr.py sdc_sim_data.campaign_2_ambiegen.json campaign_2_ambiegen
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert OpenDRIVE road data from a JSON file to .xodr files.")
+    parser.add_argument('json_file', help="Path to the input JSON file containing OpenDRIVE data.")
+    parser.add_argument('output_folder', help="Path to the folder where the output XML files will be saved.")
+    args = parser.parse_args()
+    convert_json_to_opendrive(args.json_file, args.output_folder)
@@ -7,14 +7,20 @@
     :return: Functions for processing OpenDRIVE road data and generating spline points. The main function
     `process_and_save_road_data` extracts control points, generates spline points, and saves the data to a JSON file.
 """
-import xml.etree.ElementTree as ET
+try:
+    import lxml.etree as ET  # C parser, same parse/find/findall API
+except ImportError:
+    import xml.etree.ElementTree as ET
 import numpy as np
 import os 
-import sys
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from opendrive2catmull.catmull_rom_spline import CatmullRomSpline
-import matplotlib.pyplot as plt
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from .catmull_rom_spline import CatmullRomSpline
 import json
+try:
+    import orjson  # Serializes NumPy arrays natively, falls back to the json module
+except ImportError:
+    orjson = None
 import logging
 # logging.basicConfig(level=logging.INFO)
 logging.getLogger('matplotlib.font_manager').setLevel(logging.WARNING)
@@ -32,144 +38,209 @@ def parse_geometry(geometry):
     s = float(geometry.get('s'))
     return x, y, length, hdg, s
 
-def get_elevation_and_width(road, s):
+def _segment_table(elements, s_attr):
     """
-    Extract elevation and width of the road at a given position 's'.
+    Build a table of cubic polynomial records sorted by their start position,
+    one row (s_start, s_end, a, b, c, d) per element. The attributes and their defaults
+    are converted here once, so evaluating the table needs no further lookups.
     """
-    z = 0.0  # Default elevation
-    width = 0.0  # Default width
+    table = np.array([
+        [float(elem.get(s_attr, 0)), float(elem.get('length', float('inf'))),
+         float(elem.get('a', 0.0)), float(elem.get('b', 0.0)),
+         float(elem.get('c', 0.0)), float(elem.get('d', 0.0))]
+        for elem in elements
+    ], dtype=np.float64).reshape(-1, 6)
+    table[:, 1] += table[:, 0]  # Store the end of each record instead of its length
+    return table[np.argsort(table[:, 0], kind='stable')]
 
-    # Extract elevation using the polynomial coefficients
+def _evaluate_segments(table, s):
+    """
+    Evaluate the record in effect at each position 's', i.e. the last one starting at or before it.
+    Positions before the first record or past the end of its length evaluate to 0.
+    """
+    s = np.asarray(s, dtype=np.float64)
+    if len(table) == 0:
+        return np.zeros_like(s)
+    idx = np.searchsorted(table[:, 0], s, side='right') - 1
+    row = table[np.maximum(idx, 0)]
+    ds = s - row[..., 0]
+    a, b, c, d = row[..., 2], row[..., 3], row[..., 4], row[..., 5]
+    # Horner form of a + b*ds + c*ds^2 + d*ds^3
+    value = ((d * ds + c) * ds + b) * ds + a
+    return np.where((idx >= 0) & (s < row[..., 1]), value, 0.0)
+
+def parse_elevation_profile(road):
+    """
+    Build the elevation table of a road once, see _segment_table.
+    """
     elevationProfile = road.find('elevationProfile')
-    if elevationProfile is not None:
-        for elevation in elevationProfile.findall('elevation'):
-            s_elev = float(elevation.get('s', 0))
-            length = float(elevation.get('length', float('inf')))
-            if s_elev <= s < s_elev + length:
-                a = float(elevation.get('a', 0.0))
-                b = float(elevation.get('b', 0.0))
-                c = float(elevation.get('c', 0.0))
-                d = float(elevation.get('d', 0.0))
-                ds = s - s_elev
-                z = a + b * ds + c * ds**2 + d * ds**3
-                break  # Found the correct segment
-
-    # Width extraction
-    lanes = road.find('lanes')
-    if lanes is not None:
-        for laneSection in lanes.findall('laneSection'):
-            s_section = float(laneSection.get('s'))
-            if s_section <= s:
-                lanes_side = laneSection.find('right')  # Assuming 'right' lanes for width
-                if lanes_side is not None:
-                    for lane in lanes_side.findall('lane'):
-                        lane_id = int(lane.get('id'))
-                        for width_elem in lane.findall('width'):
-                            s_offset = float(width_elem.get('sOffset', 0))
-                            length = float(width_elem.get('length', float('inf')))
-                            if s_offset <= s < s_offset + length:
-                                a = float(width_elem.get('a', 0.0))
-                                b = float(width_elem.get('b', 0.0))
-                                c = float(width_elem.get('c', 0.0))
-                                d = float(width_elem.get('d', 0.0))
-                                ds = s - s_offset
-                                lane_width = a + b * ds + c * ds**2 + d * ds**3
-                                width += lane_width
-    return z, width
+    elevations = elevationProfile.findall('elevation') if elevationProfile is not None else []
+    return _segment_table(elevations, 's')
 
-def compute_lane_offset(road, s, lane_side):
+def parse_lane_widths(road, lane_side):
     """
-    Calculate the lane offset for a given side of the road.
+    Build the lane width tables for one side of a road once: the sorted laneSection start
+    positions and, per laneSection, the width table of each of its lanes on that side.
     """
-    lane_offset = 0.0
     lanes = road.find('lanes')
-    if lanes is None:
-        return lane_offset
-
-    lane_sections = lanes.findall('laneSection')
+    lane_sections = lanes.findall('laneSection') if lanes is not None else []
+    lane_sections = sorted(lane_sections, key=lambda section: float(section.get('s')))
+    section_s = np.array([float(section.get('s')) for section in lane_sections], dtype=np.float64)
+    section_lanes = []
     for lane_section in lane_sections:
-        s_section = float(lane_section.get('s'))
-        if s_section <= s:
-            lanes_side = lane_section.find(lane_side)
-            if lanes_side is not None:
-                for lane in lanes_side.findall('lane'):
-                    lane_id = int(lane.get('id'))
-                    # Skip the center lane (id=0)
-                    if lane_id == 0:
-                        continue
-                    for width_elem in lane.findall('width'):
-                        s_offset = float(width_elem.get('sOffset', 0))
-                        length = float(width_elem.get('length', float('inf')))
-                        if s_offset <= s < s_offset + length:
-                            a = float(width_elem.get('a', 0.0))
-                            b = float(width_elem.get('b', 0.0))
-                            c = float(width_elem.get('c', 0.0))
-                            d = float(width_elem.get('d', 0.0))
-                            ds = s - s_offset
-                            width = a + b * ds + c * ds**2 + d * ds**3
-                            lane_offset += width
-                            break  # Width found for this lane
+        lanes_side = lane_section.find(lane_side)
+        side_lanes = lanes_side.findall('lane') if lanes_side is not None else []
+        # Skip the center lane (id=0)
+        section_lanes.append([_segment_table(lane.findall('width'), 'sOffset')
+                              for lane in side_lanes if int(lane.get('id')) != 0])
+    return section_s, section_lanes
+
+def get_elevation_and_width(elev_segments, lane_segments, s):
+    """
+    Extract elevation and width of the road at the position(s) 's'.
+    `lane_segments` are the 'right' lane width tables, which give the road width.
+    """
+    z = _evaluate_segments(elev_segments, s)
+    width = compute_lane_offset(lane_segments, s)
+    return z, width
+
+def compute_lane_offset(lane_segments_for_side, s):
+    """
+    Calculate the lane offset for one side of the road at the position(s) 's',
+    summing the widths of its lanes in the laneSection in effect at that position.
+    """
+    section_s, section_lanes = lane_segments_for_side
+    s = np.asarray(s, dtype=np.float64)
+    lane_offset = np.zeros_like(s)
+    section_idx = np.searchsorted(section_s, s, side='right') - 1
+    for k, lane_tables in enumerate(section_lanes):
+        in_section = section_idx == k
+        if not lane_tables or not np.any(in_section):
+            continue
+        # Width records are offset from the start of their laneSection
+        ds = s[in_section] - section_s[k]
+        for table in lane_tables:
+            lane_offset[in_section] += _evaluate_segments(table, ds)
     return lane_offset
 
 def get_road_geometry(opendrive_file: str, lane_side='right'): 
     """
     Extract road geometry data from an OpenDRIVE file.
     """
+    return _extract_lane_points(opendrive_file, (lane_side,))[0]
+
+def get_road_geometry_both_sides(opendrive_file: str):
+    """
+    Extract right and left lane road geometry data from an OpenDRIVE file in a single pass.
+    """
+    right_lane_points, left_lane_points = _extract_lane_points(opendrive_file, ('right', 'left'))
+    return right_lane_points, left_lane_points
+
+def _iter_roads(opendrive_file):
+    """
+    Stream the road elements of an OpenDRIVE file, clearing each one once it has been
+    processed so that only a single road is held in memory at a time.
+    """
+    for _, elem in ET.iterparse(opendrive_file, events=('end',)):
+        if elem.tag == 'road':
+            yield elem
+            elem.clear()
+
+def _road_lane_points(road, lane_sides):
+    """
+    Compute the road geometry points of a single road for each of the given lane sides,
+    as one (N, 4) array of (x, y, z, width) rows per side.
+    """
+    points = tuple(np.empty((0, 4)) for _ in lane_sides)
+    planView = road.find('planView')
+    if planView is None:
+        return points
+
+    geometries = []
+    for geometry in planView.findall('geometry'):
+        try:
+            geometries.append(parse_geometry(geometry))
+        except Exception as e:
+            logger.error(f"Error processing geometry data: {e}")
+    if not geometries:
+        return points
+
+    # Parse the elevation and lane width records once per road
+    elev_segments = parse_elevation_profile(road)
+    right_lane_segments = parse_lane_widths(road, 'right')
+
+    # Evaluate elevation and width for every geometry of the road at once, shared by all sides
+    x, y, _, hdg, s_geom = np.array(geometries, dtype=np.float64).T
+    z_geom, width_geom = get_elevation_and_width(elev_segments, right_lane_segments, s_geom)
+    normal = hdg + np.pi / 2
+
+    side_points = []
+    for lane_side in lane_sides:
+        if lane_side == 'right':
+            side_lane_segments = right_lane_segments
+        else:
+            side_lane_segments = parse_lane_widths(road, lane_side)
+        lane_offset = compute_lane_offset(side_lane_segments, s_geom)
+        # Offset every geometry point along its normal in one array operation
+        point_x = x + lane_offset * np.cos(normal)
+        point_y = y + lane_offset * np.sin(normal)
+        side_points.append(np.column_stack((point_x, point_y, z_geom, width_geom)))
+    return tuple(side_points)
+
+def _extract_lane_points(opendrive_file, lane_sides):
+    """
+    Extract road geometry data for each of the given lane sides, streaming the OpenDRIVE file once.
+    Returns one (N, 4) array of (x, y, z, width) rows per side.
+    """
+    points = tuple([] for _ in lane_sides)
     try:
-        tree = ET.parse(opendrive_file)
-        root = tree.getroot()
+        for road in _iter_roads(opendrive_file):
+            try:
+                # Both sides of a road are computed before the road is cleared
+                road_points = _road_lane_points(road, lane_sides)
+            except Exception as e:
+                logger.error(f"Error processing road data: {e}")
+                continue
+            for side_points, side_road_points in zip(points, road_points):
+                side_points.append(side_road_points)
     except ET.ParseError as e:
         logger.error(f"Error parsing XML file: {e}")
-        return []
-    points = []
-    for road in root.findall('road'):
-        try:
-            planView = road.find('planView')
-            if planView is None:
-                continue
+        return tuple(np.empty((0, 4)) for _ in lane_sides)
 
-            for geometry in planView.findall('geometry'):
-                try:
-                    x, y, length, hdg, s = parse_geometry(geometry)
-                    z, width = get_elevation_and_width(road, s)
-                    lane_offset = compute_lane_offset(road, s, lane_side)
-                    offset_x = lane_offset * np.cos(hdg + np.pi / 2)
-                    offset_y = lane_offset * np.sin(hdg + np.pi / 2)
-                    point_x = x + offset_x
-                    point_y = y + offset_y
-                    points.append((point_x, point_y, z, width))
-                except Exception as e:
-                    logger.error(f"Error processing geometry data: {e}")
-        except Exception as e:
-            logger.error(f"Error processing road data: {e}")
-
-    return points
+    # Join the per-road arrays of each side with a single copy
+    return tuple(np.concatenate(side_points) if side_points else np.empty((0, 4)) for side_points in points)
 
 def compute_centerline(right_lane_points, left_lane_points):
     """
     Calculate the center points between right and left lane points to create a reference line.
     """
-    control_points = []
-    for right, left in zip(right_lane_points, left_lane_points):
-        center_x = (right[0] + left[0]) / 2
-        center_y = (right[1] + left[1]) / 2
-        center_z = (right[2] + left[2]) / 2
-        center_width = (right[3] + left[3]) / 2
-        control_points.append((center_x, center_y, center_z, center_width))
-    return control_points
+    right = np.asarray(right_lane_points, dtype=np.float64)
+    left = np.asarray(left_lane_points, dtype=np.float64)
+    n = min(len(right), len(left))
+    # Average x, y, z and width of both sides in one array operation
+    return (right[:n] + left[:n]) * 0.5
 
 def generate_spline(opendrive_file: str):
     """
     Generate spline data from an OpenDRIVE file.
     """
     # Extract right and left lane points
-    right_lane_points = get_road_geometry(opendrive_file, lane_side='right')
-    left_lane_points = get_road_geometry(opendrive_file, lane_side='left')
+    right_lane_points, left_lane_points = get_road_geometry_both_sides(opendrive_file)
 
     if len(right_lane_points) < 4 or len(left_lane_points) < 4:
         logger.error(f"Not enough points for Catmull-Rom Spline in file {opendrive_file}. At least 4 points are required.")
         return [], []
 
+    return generate_spline_from_lanes(right_lane_points, left_lane_points)
+
+def generate_spline_from_lanes(right_lane_points, left_lane_points):
+    """
+    Generate spline data from already extracted right and left lane points.
+    Returns empty control and spline points if either side has fewer than 4 points.
+    """
+    if len(right_lane_points) < 4 or len(left_lane_points) < 4:
+        return [], []
+
     # Calculate centerline points
     control_points = compute_centerline(right_lane_points, left_lane_points)
 
@@ -182,9 +253,14 @@ def generate_spline(opendrive_file: str):
 def save_road_data(opendrive_file, output_file):
     """
     Extract control points from the OpenDRIVE file, generate spline points, and save them to a JSON file.
+    Returns the control points, spline points and original (right lane) points so callers do not
+    have to process the file again, or None if there are not enough points.
     """
-    # Generate spline data for the road from the OpenDRIVE file
-    control_points, spline_points = generate_spline(opendrive_file)
+    # Extract the lane points once, the right lane points double as the original road points
+    right_lane_points, left_lane_points = get_road_geometry_both_sides(opendrive_file)
+
+    # Generate spline data for the road from the lane points
+    control_points, spline_points = generate_spline_from_lanes(right_lane_points, left_lane_points)
 
     # Check if there are enough points for a valid spline
     if len(control_points) < 4 or len(spline_points) < 4:
@@ -192,26 +268,40 @@ def save_road_data(opendrive_file, output_file):
             f"Not enough points for Catmull-Rom Spline in file {opendrive_file}. "
             f"At least 4 spline points are required."
         )
-        return  # Exit the function if not enough points are available
-
-    # Ensure JSON compatibility for numpy arrays
-    points_serializable = [point.tolist() if isinstance(point, np.ndarray) else point for point in spline_points]
-    # Use the line below to filter only x and y values from the spline points. 
-    # points_serializable = [ [point[0], point[1]] for point in spline_points]
+        return None  # Exit the function if not enough points are available
 
-    # Create the output directory if it doesn't exist
+    # Create the output directory if it doesn't exist, other workers may be creating it too
     output_dir = os.path.dirname(output_file)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
 
     # Save the processed road data to the specified JSON file
-    with open(output_file, 'w') as f:
-        json.dump(points_serializable, f)
+    if orjson is not None:
+        # orjson writes the numpy array directly, no per-point conversion needed
+        # Use spline_points[:, :2] to keep only x and y values from the spline points.
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(np.ascontiguousarray(spline_points), option=orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        # Ensure JSON compatibility for numpy arrays
+        points_serializable = [point.tolist() if isinstance(point, np.ndarray) else point for point in spline_points]
+        # Use the line below to filter only x and y values from the spline points. 
+        # points_serializable = [ [point[0], point[1]] for point in spline_points]
+        with open(output_file, 'w') as f:
+            json.dump(points_serializable, f)
     
     print(f"Saved road data to {output_file}")
 
+    return control_points, spline_points, right_lane_points
+
 if __name__ == "__main__":
-    from plot_spline import plot_spline_with_lanes  # Importing the plot function
+    parser = argparse.ArgumentParser(description="Generate Catmull-Rom spline road data from OpenDRIVE files.")
+    parser.add_argument('--plot', action='store_true', help="Also save a plot of every generated spline.")
+    args = parser.parse_args()
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use('Agg')  # Only render to files, no GUI backend
+        import matplotlib.pyplot as plt
+        from .plot_spline import plot_spline_with_lanes  # Importing the plot function
     opendrive_dir = '/Users/ali/Documents/GitHub/udacity-test-generation/SensoDat/Opendrive_Files/campaign_2_frenetic'
     opendrive_files = [os.path.join(opendrive_dir, f"{i}.xodr") for i in range(10)]
     opendrive_files = [f for f in opendrive_files if os.path.exists(f)]
@@ -221,27 +311,29 @@ if __name__ == "__main__":
     
     plot_dir = '/Users/ali/Documents/GitHub/udacity-test-generation/SensoDat/Plots/campaign_2_frenetic_plots'
 
-    if not os.path.exists(plot_dir):
+    if args.plot and not os.path.exists(plot_dir):
         os.makedirs(plot_dir)
 
+    output_files = []
     for i, opendrive_file in enumerate(opendrive_files):
-        output_file = os.path.join(output_dir, f"{i}.json")
         logger.debug(f"Processing file: {opendrive_file}")
-        
-        # Process and save the spline points directly
-        save_road_data(opendrive_file, output_file)
-        
-        # Load spline data to plot (optional)
-        control_points, spline_points = generate_spline(opendrive_file)
-        if len(spline_points) > 0:
-            original_points = get_road_geometry(opendrive_file)
+        output_files.append(os.path.join(output_dir, f"{i}.json"))
+
+    # Process and save the spline points of every file in parallel, keeping the results for plotting
+    with ProcessPoolExecutor() as executor:
+        results = list(executor.map(save_road_data, opendrive_files, output_files))
+
+    # Plot the spline data serially, matplotlib is not process-safe (only with --plot)
+    for i, road_data in enumerate(results):
+        if road_data is None:
+            logger.error("Failed to generate spline data.")
+        elif args.plot:
+            control_points, spline_points, original_points = road_data
             original_points = original_points[1:]  # Adjusting to plot without the first point if needed
-            plt.figure()  # Create a new figure for each plot
-            plot_spline_with_lanes(spline_points, original_points, spline_color='yellow', points_color='red')
+            fig, ax = plt.subplots()  # Create a new figure for each plot
+            plot_spline_with_lanes(spline_points, original_points, spline_color='yellow', points_color='red', ax=ax)
             # Save the plot to the plot directory with a unique filename
             plot_filename = os.path.join(plot_dir, f"road_{i}.png")
-            plt.savefig(plot_filename)
-            plt.close()
-        else:
-            logger.error("Failed to generate spline data.")
+            fig.savefig(plot_filename)
+            plt.close(fig)
     print("Done processing all files.")
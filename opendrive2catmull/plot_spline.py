@@ -1,13 +1,6 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import sys
-import os
-
-# Add the parent directory to the sys.path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from opendrive2catmull.opendrive_converter import extract_road_geometry
-from opendrive2catmull.catmull_rom_spline import CatmullRomSpline
 
 def plot_spline_with_lanes(spline, points=None, spline_color='skyblue', points_color='green', ax=None):
     spline = np.array(spline)